@@ -1,12 +1,18 @@
 import eventlet
 eventlet.monkey_patch()
+from eventlet import tpool
 
 import os
 import io
+import re
+import math
 import time
 import queue
 import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import numpy as np
+import tiktoken
 import webrtcvad
 from flask import Flask, render_template, request
 from flask_socketio import SocketIO, emit
@@ -23,11 +29,13 @@ socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
 # Initialize modules
 print("Initializing STT model (faster-whisper)...")
-stt_model = STT(model_size="tiny")
+stt_model = STT(model_size="tiny", language=os.getenv("STT_LANGUAGE", "en") or None)
+stt_model.warmup()
 print("STT model ready.")
 
 print("Initializing TTS engine...")
 tts_engine = TTS()
+tts_pool = ThreadPoolExecutor(max_workers=4) # Sentences synthesized concurrently
 print("TTS engine ready.")
 
 print("Initializing OpenAI client...")
@@ -39,22 +47,74 @@ SAMPLE_RATE = 16000
 FRAME_DURATION = 30  # ms
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION / 1000)
 VAD_MODE = 0 # Most sensitive mode
+FRAME_BYTES = FRAME_SIZE * 2 # 480 samples * 2 bytes
+END_SILENCE_FRAMES = 300 / FRAME_DURATION # 300ms of silence ends an utterance (reduced for lower latency)
+VAD_BUFFER_SIZE = 8192 # Initial VAD staging buffer size (grows if a chunk doesn't fit)
+TOKEN_FLUSH_INTERVAL = 0.04 # Max seconds a token waits before being sent to the UI
+TOKEN_BATCH_MAX = 50 # Max tokens per llm_token event
+CONVERSATION_TOKEN_BUDGET = 2000 # History sent to the LLM is trimmed to this many tokens
 SYSTEM_PROMPT = "Be as pookie as possible and respond to me in a cute way without any emojis"
 
+# Sentence endings that trigger TTS for the buffered text
+SENTENCE_END = re.compile(r"[.!?\n]")
+
 # Session state storage
 sessions = {}
 
+# Tokenizer for the history budget; each message is encoded exactly once
+encoder = tiktoken.encoding_for_model("gpt-4o-mini")
+
 class SessionState:
     def __init__(self):
         self.vad = webrtcvad.Vad(VAD_MODE)
-        self.vad_buffer = bytearray()
-        self.audio_buffer = []
+        # Preallocated VAD staging buffer; frames are sliced via head/tail offsets instead of del
+        self.vad_buf = bytearray(VAD_BUFFER_SIZE)
+        self.vad_mv = memoryview(self.vad_buf)
+        self.vad_head = 0
+        self.vad_tail = 0
+        self.audio_buffer = bytearray() # Utterance PCM, extended in place frame by frame
         self.is_recording = False
         self.silent_frames = 0
         self.speech_frames = 0
         self.conversation = [{"role": "system", "content": SYSTEM_PROMPT}]
+        self.conversation_tokens = [len(encoder.encode(SYSTEM_PROMPT))] # Parallel to conversation
         self.last_activity = time.time()
         self.processing = False
+        # Debug energy stats: running int sum of squares, reported every 50 chunks
+        self.chunk_count = 0
+        self.rms_sumsq = 0
+        self.rms_samples = 0
+
+    def add_message(self, role, content):
+        """Appends a turn, then drops the oldest non-system turns until the history fits the budget."""
+        self.conversation.append({"role": role, "content": content})
+        self.conversation_tokens.append(len(encoder.encode(content)))
+        total = sum(self.conversation_tokens)
+        # Always keep the system prompt and the newest message
+        while total > CONVERSATION_TOKEN_BUDGET and len(self.conversation) > 2:
+            self.conversation.pop(1)
+            total -= self.conversation_tokens.pop(1)
+
+    def push_vad(self, data):
+        """Appends raw PCM to the VAD staging buffer, compacting or growing it only when full."""
+        if self.vad_head == self.vad_tail:
+            self.vad_head = self.vad_tail = 0
+        n = len(data)
+        if self.vad_tail + n > len(self.vad_buf):
+            pending = bytes(self.vad_mv[self.vad_head:self.vad_tail])
+            size = len(self.vad_buf)
+            while len(pending) + n > size:
+                size *= 2
+            if size != len(self.vad_buf):
+                # A bytearray can't be resized while a memoryview is exported
+                self.vad_mv.release()
+                self.vad_buf = bytearray(size)
+                self.vad_mv = memoryview(self.vad_buf)
+            self.vad_buf[:len(pending)] = pending
+            self.vad_head = 0
+            self.vad_tail = len(pending)
+        self.vad_buf[self.vad_tail:self.vad_tail + n] = data
+        self.vad_tail += n
 
 @app.route('/')
 def index():
@@ -86,19 +146,17 @@ def handle_audio_chunk(data):
     state = sessions[sid]
     state.last_activity = time.time()
     
-    if not hasattr(state, 'chunk_count'): state.chunk_count = 0
     state.chunk_count += 1
     
-    # Calculate RMS energy to check for silence
-    audio_np = np.frombuffer(data, dtype=np.int16).astype(np.float64)
-    rms = np.sqrt(np.mean(audio_np**2))
-    
-    if not hasattr(state, 'rms_buffer'): state.rms_buffer = []
-    state.rms_buffer.append(rms)
+    # Accumulate energy in int32/int64 (no float64 upcast); RMS is only needed for the debug print
+    samples = np.frombuffer(data, dtype=np.int16).astype(np.int32)
+    state.rms_sumsq += int((samples * samples).sum())
+    state.rms_samples += samples.size
 
     if state.chunk_count % 50 == 0:
-        avg_rms = sum(state.rms_buffer) / len(state.rms_buffer) if state.rms_buffer else 0
-        state.rms_buffer = [] # Reset buffer
+        avg_rms = math.sqrt(state.rms_sumsq / state.rms_samples) if state.rms_samples else 0
+        state.rms_sumsq = 0 # Reset accumulator
+        state.rms_samples = 0
         print(f"[{sid}] Received 50 audio chunks (Total: {state.chunk_count}) | Avg RMS: {avg_rms:.2f}")
 
     if state.processing:
@@ -106,68 +164,101 @@ def handle_audio_chunk(data):
 
     
     # Add to internal VAD buffer
-    state.vad_buffer.extend(data)
+    state.push_vad(data)
     
-    # Process all complete 30ms frames (960 bytes) in the buffer
-    FRAME_BYTES = 960 # 480 samples * 2 bytes
+    # Hoist hot attributes into locals for the per-frame loop; state is written back once at the end
+    vad_is_speech = state.vad.is_speech
+    vad_mv = state.vad_mv
+    head = state.vad_head
+    tail = state.vad_tail
+    audio_buffer = state.audio_buffer
+    is_recording = state.is_recording
+    silent_frames = state.silent_frames
+    speech_frames = state.speech_frames
     
-    while len(state.vad_buffer) >= FRAME_BYTES:
-        frame = bytes(state.vad_buffer[:FRAME_BYTES])
-        del state.vad_buffer[:FRAME_BYTES]
+    # Process all complete 30ms frames (960 bytes) in the buffer
+    while tail - head >= FRAME_BYTES:
+        # webrtcvad only accepts immutable bytes, so the frame itself is still copied out
+        frame = bytes(vad_mv[head:head + FRAME_BYTES])
+        head += FRAME_BYTES
         
         is_speech = False
         try:
-            is_speech = state.vad.is_speech(frame, SAMPLE_RATE)
+            is_speech = vad_is_speech(frame, SAMPLE_RATE)
         except Exception as e:
             print(f"VAD Error: {e}")
             continue
 
         if is_speech:
-            if not state.is_recording:
-                state.is_recording = True
+            if not is_recording:
+                is_recording = True
                 print(f"[{sid}] VAD: Speech detected. Starting recording.")
                 emit('status', {'state': 'listening'})
             
-            state.audio_buffer.append(frame)
-            state.speech_frames += 1
-            state.silent_frames = 0
+            audio_buffer += frame
+            speech_frames += 1
+            silent_frames = 0
         else:
-            if state.is_recording:
-                state.silent_frames += 1
-                state.audio_buffer.append(frame)
+            if is_recording:
+                silent_frames += 1
+                audio_buffer += frame
                 
                 # End detection: 300ms of silence (reduced for lower latency)
-                if state.silent_frames > (300 / FRAME_DURATION):
-                    state.is_recording = False
+                if silent_frames > END_SILENCE_FRAMES:
+                    is_recording = False
                     emit('status', {'state': 'processing'})
                     
-                    audio_to_process = b"".join(state.audio_buffer)
-                    state.audio_buffer = []
-                    state.silent_frames = 0
-                    state.speech_frames = 0
+                    audio_to_process = bytes(audio_buffer)
+                    audio_buffer = state.audio_buffer = bytearray()
+                    silent_frames = 0
+                    speech_frames = 0
                     
                     socketio.start_background_task(process_speech, sid, audio_to_process)
 
-def tts_worker(sid, tts_queue):
-    """Background worker that processes TTS requests from the queue."""
+    state.vad_head = head
+    state.is_recording = is_recording
+    state.silent_frames = silent_frames
+    state.speech_frames = speech_frames
+
+@lru_cache(maxsize=256)
+def synthesize_cached(text):
+    """Synthesizes a normalized sentence, caching the audio so repeated phrases skip the TTS call."""
+    audio_response_bytes = tts_engine.get_audio_bytes(text)
+    if not audio_response_bytes:
+        # Raising keeps failures out of the cache so the sentence is retried next time
+        raise RuntimeError("TTS generation failed")
+    return audio_response_bytes
+
+def synthesize_chunk(sid, text, index):
+    """Runs on the TTS pool: synthesizes one sentence and returns its audio bytes (or None)."""
+    t_start = time.time()
+    print(f"[{sid}] TTS chunk {index}: {text[:40]}...")
+    try:
+        audio_response_bytes = synthesize_cached(" ".join(text.split()))
+    except RuntimeError:
+        audio_response_bytes = None
+    if audio_response_bytes:
+        elapsed = time.time() - t_start
+        print(f"[{sid}] TTS chunk {index} ready ({len(audio_response_bytes)} bytes, {elapsed:.2f}s)")
+    return audio_response_bytes
+
+def tts_emitter(sid, tts_queue):
+    """Background worker that emits pooled TTS results in chunk order."""
     while True:
         item = tts_queue.get()
         if item is None:  # Sentinel to stop
             break
-        text, index = item
+        index, future = item
         try:
-            t_start = time.time()
-            print(f"[{sid}] TTS chunk {index}: {text[:40]}...")
-            audio_response_bytes = tts_engine.get_audio_bytes(text)
+            audio_response_bytes = future.result()
             if audio_response_bytes:
-                elapsed = time.time() - t_start
-                print(f"[{sid}] TTS chunk {index} ready ({len(audio_response_bytes)} bytes, {elapsed:.2f}s)")
                 socketio.emit('bot_audio', {'audio': audio_response_bytes, 'index': index}, room=sid)
             else:
                 print(f"[{sid}] TTS generation failed for chunk {index}, sending skip")
                 socketio.emit('bot_audio_skip', {'index': index}, room=sid)
         except Exception as e:
             print(f"TTS worker error (chunk {index}): {e}")
+            socketio.emit('bot_audio_skip', {'index': index}, room=sid)
 
 def process_speech(sid, audio_bytes):
     if sid not in sessions:
@@ -179,8 +270,12 @@ def process_speech(sid, audio_bytes):
     try:
         # Step 1: Transcribe
         t0 = time.time()
-        audio_np = np.frombuffer(audio_bytes, dtype=np.int16).astype(np.float32) / 32768.0
-        text, info = stt_model.transcribe(audio_np)
+        # Single fused int16 -> normalized float32 pass, no intermediate temporary
+        samples = np.frombuffer(audio_bytes, dtype=np.int16)
+        audio_np = np.empty(samples.shape, dtype=np.float32)
+        np.multiply(samples, np.float32(1.0 / 32768.0), out=audio_np, casting='unsafe')
+        # Run the CPU-bound transcription on a native thread so the eventlet hub keeps serving other sessions
+        text, info = tpool.execute(stt_model.transcribe, audio_np)
         stt_time = time.time() - t0
         
         if not text.strip() or len(text.strip()) < 2:
@@ -190,7 +285,7 @@ def process_speech(sid, audio_bytes):
 
         print(f"[{sid}] You: {text} (STT: {stt_time:.2f}s)")
         socketio.emit('transcription', {'text': text}, room=sid)
-        state.conversation.append({"role": "user", "content": text})
+        state.add_message("user", text)
 
         # Step 2 & 3: Streaming LLM with PARALLEL TTS
         print(f"[{sid}] Starting LLM stream...")
@@ -202,15 +297,20 @@ def process_speech(sid, audio_bytes):
             stream=True
         )
 
-        # Start TTS worker thread — it processes sentences as they arrive
+        # Sentences are synthesized in parallel on the TTS pool; the emitter
+        # thread sends the results back in chunk order as they complete
         tts_queue = queue.Queue()
-        tts_thread = threading.Thread(target=tts_worker, args=(sid, tts_queue), daemon=True)
+        tts_thread = threading.Thread(target=tts_emitter, args=(sid, tts_queue), daemon=True)
         tts_thread.start()
 
         full_reply = ""
         sentence_buffer = ""
         chunk_index = 0
         first_token_time = None
+        # UI token emits are coalesced; batch size grows so the first token still goes out alone
+        pending_tokens = []
+        next_batch_size = 1
+        last_flush = time.time()
         
         for chunk in stream:
             token = chunk.choices[0].delta.content
@@ -221,22 +321,32 @@ def process_speech(sid, audio_bytes):
                 
                 full_reply += token
                 sentence_buffer += token
-                # Emit token immediately for UI
-                socketio.emit('llm_token', {'token': token}, room=sid)
-
-                # Check for sentence boundaries (only proper sentence endings)
-                if any(p in sentence_buffer for p in ['.', '!', '?', '\n']) and len(sentence_buffer) > 15:
+                # Coalesce tokens for the UI instead of one event per token
+                pending_tokens.append(token)
+                now = time.time()
+                if len(pending_tokens) >= next_batch_size or now - last_flush > TOKEN_FLUSH_INTERVAL:
+                    socketio.emit('llm_token', {'tokens': pending_tokens}, room=sid)
+                    pending_tokens = []
+                    last_flush = now
+                    next_batch_size = min(next_batch_size * 3, TOKEN_BATCH_MAX)
+
+                # Check for sentence boundaries (only proper sentence endings);
+                # the rest of the buffer was already scanned, so only the new token is searched
+                if len(sentence_buffer) > 15 and SENTENCE_END.search(token):
                     sentence = sentence_buffer.strip()
                     sentence_buffer = ""
-                    # Non-blocking: push to TTS worker queue
-                    tts_queue.put((sentence, chunk_index))
+                    # Non-blocking: submit to the TTS pool, emitter keeps the order
+                    tts_queue.put((chunk_index, tts_pool.submit(synthesize_chunk, sid, sentence, chunk_index)))
                     chunk_index += 1
 
+        if pending_tokens:
+            socketio.emit('llm_token', {'tokens': pending_tokens}, room=sid)
+
         # Final sentence if any remains
         if sentence_buffer.strip():
-            tts_queue.put((sentence_buffer.strip(), chunk_index))
+            tts_queue.put((chunk_index, tts_pool.submit(synthesize_chunk, sid, sentence_buffer.strip(), chunk_index)))
 
-        # Signal TTS worker to finish and wait
+        # Signal TTS emitter to finish and wait
         tts_queue.put(None)
         tts_thread.join()
 
@@ -244,7 +354,7 @@ def process_speech(sid, audio_bytes):
         socketio.emit('tts_complete', {'total_chunks': chunk_index}, room=sid)
 
         total_time = time.time() - t0
-        state.conversation.append({"role": "assistant", "content": full_reply})
+        state.add_message("assistant", full_reply)
         print(f"[{sid}] Bot (Full): {full_reply}")
         print(f"[{sid}] Total pipeline: {total_time:.2f}s")
 
@@ -1,7 +1,8 @@
 import os
-import base64
+import binascii
 import json
 import time
+import queue
 from dotenv import load_dotenv
 
 from hume.client import HumeClient
@@ -9,6 +10,9 @@ from hume.empathic_voice.types import AudioInput, SubscribeEvent, ConnectSession
 
 load_dotenv()
 
+SEND_QUEUE_SIZE = 64 # Max pending audio frames before the oldest are dropped
+SEND_COALESCE_BYTES = 4096 # Consecutive queued frames are merged into one send up to this size
+
 class HumeEVIBridge:
     def __init__(self, socket_instance, session_id, config_id=None):
         self.socket = socket_instance
@@ -19,6 +23,8 @@ class HumeEVIBridge:
         self.hume_socket = None # The actual websocket connection
         self.is_connected = False
         self.stop_event = False
+        # Audio is handed to a sender greenlet so the socket handler never waits on Hume
+        self._send_q = queue.Queue(maxsize=SEND_QUEUE_SIZE)
 
     def start(self):
         """Connects to Hume EVI and starts the message processing loop (Sync)."""
@@ -46,6 +52,7 @@ class HumeEVIBridge:
                 self.hume_socket = hume_socket
                 self.is_connected = True
                 print(f"[{self.sid}] Connected to Hume EVI.")
+                self.socket.start_background_task(self._sender_loop)
                 
                 # Notify frontend we are ready
                 # socket.emit is thread-safe for Flask-SocketIO (and works in greenlets)
@@ -64,27 +71,69 @@ class HumeEVIBridge:
         finally:
             self.is_connected = False
             self.hume_socket = None
+            self._enqueue(None) # Stop the sender loop
             print(f"[{self.sid}] Hume connection closed.")
 
     def stop(self):
         self.stop_event = True
         self.is_connected = False # Immediately flag as disconnected to stop sending audio
+        self._enqueue(None) # Wake the sender loop so it exits
 
     def send_audio(self, audio_data: bytes):
-        """Sends raw PCM audio (bytes) to Hume (Sync)."""
+        """Queues raw PCM audio (bytes) for the sender loop; returns immediately."""
         if self.is_connected and self.hume_socket:
+            self._enqueue(audio_data)
+
+    def _enqueue(self, item):
+        """Puts an item on the send queue, dropping the oldest frame if it is full."""
+        while True:
             try:
-                # Convert bytes to base64 string
-                b64_data = base64.b64encode(audio_data).decode('utf-8')
-                
-                # Create AudioInput message
-                audio_input = AudioInput(data=b64_data)
-                
-                # Send via socket (Sync)
-                self.hume_socket.send_audio_input(audio_input)
-                
-            except Exception as e:
-                print(f"[{self.sid}] Error sending audio: {e}")
+                self._send_q.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._send_q.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _sender_loop(self):
+        """Base64-encodes and sends queued audio to Hume, merging frames that piled up."""
+        while True:
+            audio_data = self._send_q.get()
+            if audio_data is None:
+                break
+
+            frames = [audio_data]
+            total = len(audio_data)
+            done = False
+            while total < SEND_COALESCE_BYTES:
+                try:
+                    nxt = self._send_q.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    done = True
+                    break
+                frames.append(nxt)
+                total += len(nxt)
+
+            hume_socket = self.hume_socket
+            if self.is_connected and hume_socket:
+                try:
+                    # Convert bytes to base64 string (binascii skips base64's wrapper overhead)
+                    b64_data = binascii.b2a_base64(b"".join(frames), newline=False).decode('ascii')
+                    
+                    # Create AudioInput message
+                    audio_input = AudioInput(data=b64_data)
+                    
+                    # Send via socket (Sync)
+                    hume_socket.send_audio_input(audio_input)
+                    
+                except Exception as e:
+                    print(f"[{self.sid}] Error sending audio: {e}")
+
+            if done:
+                break
 
     def _handle_hume_message(self, message: SubscribeEvent):
         """Dispatches Hume events to the browser."""
@@ -126,8 +175,9 @@ class HumeEVIBridge:
             # Binary audio data
             # message.data is a base64 string
             try:
-                audio_bytes = base64.b64decode(message.data)
-                self.socket.emit('bot_audio', {'audio': audio_bytes}, room=self.sid, namespace='/hume')
+                audio_bytes = binascii.a2b_base64(message.data)
+                # Emit raw bytes (not wrapped in a dict) so Socket.IO sends a plain binary attachment
+                self.socket.emit('bot_audio', audio_bytes, room=self.sid, namespace='/hume')
             except Exception as e:
                 print(f"[{self.sid}] Audio decode error: {e}")
             
@@ -1,7 +1,9 @@
 import os
+import re
 import time
 import queue
 import threading
+import httpx
 import numpy as np
 import sounddevice as sd
 import webrtcvad
@@ -16,27 +18,63 @@ init(autoreset=True)
 # ---- Config ----
 load_dotenv()
 SAMPLE_RATE = 16000
-FRAME_DURATION = 30  # ms
+FRAME_DURATION = 20  # ms (webrtcvad supports 10/20/30; 20 gives finer speech boundaries)
 FRAME_SIZE = int(SAMPLE_RATE * FRAME_DURATION / 1000)
 VAD_MODE = 3
 CHANNELS = 1
+MAX_UTTERANCE_SEC = 30 # Longer utterances are truncated (Whisper's window is 30s anyway)
+RING_FRAMES = 256 # Capture ring slots (~5s of 20ms frames); the consumer is never this far behind
 
 # Energy threshold (0.0 to 1.0) - Adjust based on environment
 # If you are hearing yourself too much, increase this or check diagnostics.
 ENERGY_THRESHOLD = 0.02 # Increased from 0.01
 
+# Sentence endings that hand the buffered reply text to TTS. Punctuation only counts once whitespace
+# follows it, so "$3.50" stays whole; the length floor keeps "Dr." or "e.g." from being spoken alone.
+SENTENCE_END = re.compile(r"[.!?][\"')]*\s")
+MIN_SENTENCE_CHARS = 15
+
+# Speech/silence windows over a bitmask of the most recent VAD decisions (bit 0 = newest frame)
+SPEECH_START_WINDOW = 5   # Start recording when this window (~100ms) ...
+SPEECH_START_MIN = 5      # ... holds at least this many speech frames
+SPEECH_START_MASK = (1 << SPEECH_START_WINDOW) - 1
+SILENCE_END_MASK = (1 << (int(800 / FRAME_DURATION) + 1)) - 1  # >800ms of silence ends an utterance
+VAD_HISTORY_MASK = (1 << 64) - 1
+
+# History: messages kept verbatim after the system prompt; the oldest batch is folded into a summary
+MAX_HISTORY_MESSAGES = 20
+SUMMARY_BATCH = 10
+
 # System Prompt
 SYSTEM_PROMPT = "You are a helpful, extremely concise live assistant. Respond naturally but keep answers under 20 words where possible."
 
 class LiveAssistant:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.stt = STT(model_size="base")
+        # Persistent HTTP/2 client: one warm TLS connection is reused across turns
+        http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60.0),
+            timeout=30.0
+        )
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
+        self.stt = STT(model_size="base", language=os.getenv("STT_LANGUAGE", "en") or None)
+        if os.getenv("PREWARM", "1") == "1":
+            # Pay model warmup at boot instead of on the first utterance
+            self.stt.warmup()
         self.tts = TTS()
         self.vad = webrtcvad.Vad(VAD_MODE)
-        self.audio_queue = queue.Queue()
+        self._vad_zero_copy = self._probe_vad_buffer()
+        self.audio_queue = queue.SimpleQueue() # Carries ring slot indices, not arrays
+        # Preallocated int16 capture ring: the audio callback copies into a fixed slot instead of allocating
+        self._ring = np.empty((RING_FRAMES, FRAME_SIZE), dtype=np.int16)
+        self._widx = 0
+        # Preallocated int16 utterance arena: recorded frames are copied in, no list + concatenate
+        self._utt = np.empty(SAMPLE_RATE * MAX_UTTERANCE_SEC, dtype=np.int16)
+        self._utt_len = 0
         self.conversation = [{"role": "system", "content": SYSTEM_PROMPT}]
         self.is_recording = False
+        # Energy gate as a sum of squares over an int16 frame, so no sqrt/mean is needed per frame
+        self._rms_gate_ss = (ENERGY_THRESHOLD * 32768) ** 2 * FRAME_SIZE
         
         # Echo suppression flags
         self.last_stop_talking_time = 0
@@ -44,29 +82,69 @@ class LiveAssistant:
         self.interruption_cooldown = 2.0  # Increased to 2 seconds
         self.post_speech_silence = 0.8    # Increased to 0.8 seconds to catch echo tail
 
+        # One persistent STT/LLM worker; the bounded queue caps backlog instead of stacking threads
+        self._stt_q = queue.Queue(maxsize=2)
+        self._reply_gen = 0  # Bumped on interruption so the reply being streamed stops queuing speech
+        threading.Thread(target=self._stt_worker, daemon=True).start()
+
     def audio_callback(self, indata, frames, time, status):
-        self.audio_queue.put(indata.copy())
+        i = self._widx
+        # RawInputStream hands over raw int16 PCM; view it without conversion
+        np.copyto(self._ring[i], np.frombuffer(indata, dtype=np.int16))
+        self._widx = (i + 1) % RING_FRAMES
+        self.audio_queue.put(i)
+
+    def _stt_worker(self):
+        """Processes finished utterances one at a time."""
+        while True:
+            audio_data = self._stt_q.get()
+            self.process_audio(audio_data)
+
+    def _probe_vad_buffer(self):
+        """Checks once whether the webrtcvad binding accepts a memoryview (buffer protocol) frame."""
+        try:
+            self.vad.is_speech(memoryview(np.zeros(FRAME_SIZE, dtype=np.int16)).cast('B'), SAMPLE_RATE)
+            return True
+        except TypeError:
+            return False
+
+    def _flush_capture(self):
+        """Drops all pending captured frames in O(1) by swapping in a fresh queue."""
+        # The callback looks up self.audio_queue on every block, so the next frame lands in the new one
+        self.audio_queue = queue.SimpleQueue()
+
+    def stop(self):
+        """Wakes the run loop and makes it exit."""
+        self.audio_queue.put(None)
+
+    def _record_frame(self, frame):
+        """Appends one captured frame to the utterance arena (dropped once the arena is full)."""
+        end = self._utt_len + FRAME_SIZE
+        if end <= self._utt.shape[0]:
+            self._utt[self._utt_len:end] = frame
+            self._utt_len = end
 
     def run(self):
         print(f"{Fore.GREEN}{Style.BRIGHT}Live Assistant Started. Speak to begin...{Style.RESET_ALL}")
         
-        with sd.InputStream(
+        # Capture int16 directly: the VAD consumes int16 and STT converts once per utterance
+        with sd.RawInputStream(
             samplerate=SAMPLE_RATE,
             channels=CHANNELS,
-            dtype='float32',
-            blocksize=FRAME_SIZE,
+            dtype='int16',
+            blocksize=FRAME_SIZE,  # One PortAudio buffer == one VAD frame
+            latency='low',  # PortAudio otherwise picks the "high" default (often 100ms+ on ALSA)
             callback=self.audio_callback
         ):
-            audio_buffer = []
-            silent_frames = 0
-            speech_frames_count = 0
+            vad_history = 0
             was_playing = False
             
             while True:
-                try:
-                    frame = self.audio_queue.get(timeout=0.1)
-                except queue.Empty:
-                    continue
+                # Block until the callback delivers a frame (every 20ms while the stream is open)
+                slot = self.audio_queue.get()
+                if slot is None:  # Sentinel from stop()
+                    break
+                frame = self._ring[slot]
 
                 now = time.time()
                 is_currently_playing = self.tts.is_playing
@@ -75,22 +153,24 @@ class LiveAssistant:
                 if was_playing and not is_currently_playing:
                     self.last_stop_talking_time = now
                     # Flush queue to avoid trailing bot voice
-                    while not self.audio_queue.empty(): self.audio_queue.get()
+                    self._flush_capture()
                 
                 was_playing = is_currently_playing
                 
-                # Energy calculation (RMS)
-                rms = np.sqrt(np.mean(frame**2))
+                # Energy as a sum of squares: one fused int64 pass, no squared temporary
+                ss = int(np.einsum('i,i->', frame, frame, dtype=np.int64))
                 
                 # Diagnostic help: Uncomment to see energy levels and calibrate ENERGY_THRESHOLD
+                # rms = np.sqrt(ss / FRAME_SIZE) / 32768.0
                 # if rms > 0.005: print(f" Energy: {rms:.4f}") 
                 
-                # Convert to int16 for VAD
-                audio_int16 = (frame[:, 0] * 32768).astype(np.int16)
-                is_speech = self.vad.is_speech(audio_int16.tobytes(), SAMPLE_RATE)
+                # Frames are already int16, so the VAD gets them as-is; a byte view of the
+                # ring slot avoids allocating a bytes copy when the binding supports it
+                vad_frame = frame.data.cast('B') if self._vad_zero_copy else frame.tobytes()
+                is_speech = self.vad.is_speech(vad_frame, SAMPLE_RATE)
                 
                 # Apply energy threshold to filter out low-level noise
-                if rms < ENERGY_THRESHOLD:
+                if ss < self._rms_gate_ss:
                     is_speech = False
 
                 # --- ECHO SUPPRESSION & INTERRUPTION LOGIC ---
@@ -103,11 +183,12 @@ class LiveAssistant:
                     
                     if is_speech:
                         print(f"\n{Fore.YELLOW}[Interrupted!]{Style.RESET_ALL}")
-                        self.tts.stop()
+                        self._reply_gen += 1
+                        self.tts.stop_local()
                         self.last_stop_talking_time = now
                         self.playback_start_time = 0
-                        audio_buffer = []
-                        while not self.audio_queue.empty(): self.audio_queue.get()
+                        self._utt_len = 0
+                        self._flush_capture()
                         continue
                 else:
                     self.playback_start_time = 0
@@ -115,38 +196,62 @@ class LiveAssistant:
                         continue
 
                 # --- RECORDING LOGIC ---
+                vad_history = ((vad_history << 1) | int(is_speech)) & VAD_HISTORY_MASK
                 if is_speech:
-                    speech_frames_count += 1
-                    # Require at least 3 frames (~90ms) of consistent speech to start recording
-                    if not self.is_recording and speech_frames_count > 3:
+                    # Require ~100ms of consistent speech to start recording
+                    if not self.is_recording and (vad_history & SPEECH_START_MASK).bit_count() >= SPEECH_START_MIN:
                         print(f"{Fore.MAGENTA}Listening...{Style.RESET_ALL}", end="", flush=True)
                         self.is_recording = True
                     
                     if self.is_recording:
-                        audio_buffer.append(frame)
-                    silent_frames = 0
+                        self._record_frame(frame)
                 else:
                     if self.is_recording:
-                        silent_frames += 1
-                        audio_buffer.append(frame)
+                        self._record_frame(frame)
                         
                         # Use a dynamic silence window (800ms)
-                        if silent_frames > (800 / FRAME_DURATION):
+                        if vad_history & SILENCE_END_MASK == 0:
                             print(f"{Fore.GREEN} Done.{Style.RESET_ALL}")
                             # Final sanity check: was it long enough?
-                            if len(audio_buffer) > (SAMPLE_RATE * 0.5 / FRAME_SIZE):
-                                threading.Thread(target=self.process_audio, args=(audio_buffer.copy(),), daemon=True).start()
+                            if self._utt_len > SAMPLE_RATE * 0.5:
+                                # Single int16 -> float32 pass per utterance; also frees the arena for reuse
+                                audio_f32 = np.empty(self._utt_len, dtype=np.float32)
+                                np.multiply(self._utt[:self._utt_len], np.float32(1.0 / 32768.0), out=audio_f32, casting='unsafe')
+                                try:
+                                    self._stt_q.put_nowait(audio_f32)
+                                except queue.Full:
+                                    print(f"{Fore.RED}STT busy, dropping utterance.{Style.RESET_ALL}")
                             
-                            audio_buffer = []
+                            self._utt_len = 0
                             self.is_recording = False
-                            silent_frames = 0
-                            speech_frames_count = 0
-                    else:
-                        speech_frames_count = 0
+                            vad_history = 0
 
-    def process_audio(self, audio_buffer):
-        audio_data = np.concatenate(audio_buffer, axis=0).flatten()
-        
+    def _compact_history(self):
+        """Replaces the oldest turns with a short summary once the history grows past the limit."""
+        if len(self.conversation) <= MAX_HISTORY_MESSAGES + 1:
+            return
+        old = self.conversation[1:SUMMARY_BATCH + 1]
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in old)
+        try:
+            response = self.client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": "Summarize this conversation in under 40 words."},
+                    {"role": "user", "content": transcript}
+                ],
+                temperature=0.3
+            )
+            summary = response.choices[0].message.content
+        except Exception as e:
+            print(f"{Fore.RED}Summary error: {e}{Style.RESET_ALL}")
+            return
+        # An earlier summary note is part of the old batch, so it gets folded into the new one
+        self.conversation = [
+            self.conversation[0],
+            {"role": "system", "content": "Earlier: " + summary}
+        ] + self.conversation[SUMMARY_BATCH + 1:]
+
+    def process_audio(self, audio_data):
         print(f"{Fore.CYAN}Transcribing...{Style.RESET_ALL}")
         text, info = self.stt.transcribe(audio_data)
         
@@ -159,15 +264,40 @@ class LiveAssistant:
 
         print(f"{Fore.YELLOW}Thinking...{Style.RESET_ALL}")
         try:
-            response = self.client.chat.completions.create(
+            # Stream the reply and start speaking each sentence while later tokens still arrive
+            gen = self._reply_gen
+            stream = self.client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=self.conversation,
-                temperature=0.7
+                temperature=0.7,
+                stream=True
             )
-            reply = response.choices[0].message.content
+            reply = ""
+            sentence = ""
+            for chunk in stream:
+                if gen != self._reply_gen:
+                    # The user talked over the bot: stop generating and drop the unspoken rest
+                    stream.close()
+                    print(f"{Fore.YELLOW}(reply cut off){Style.RESET_ALL}")
+                    break
+                token = chunk.choices[0].delta.content if chunk.choices else None
+                if not token:
+                    continue
+                reply += token
+                sentence += token
+                # The whitespace may arrive with the next token, so look back over the punctuation too
+                end = SENTENCE_END.search(sentence, max(len(sentence) - len(token) - 3, 0))
+                if end and end.end() > MIN_SENTENCE_CHARS:
+                    # The TTS player synthesizes and plays queued sentences in order
+                    self.tts.speak_local(sentence[:end.end()].strip())
+                    sentence = sentence[end.end():]
+            if sentence.strip() and gen == self._reply_gen:
+                self.tts.speak_local(sentence.strip())
+
             print(f"{Fore.GREEN}{Style.BRIGHT}Bot: {reply}{Style.RESET_ALL}")
             self.conversation.append({"role": "assistant", "content": reply})
-            self.tts.speak(reply)
+            # Runs on the STT worker after the reply is queued for speech, so it never delays it
+            self._compact_history()
         except Exception as e:
             print(f"{Fore.RED}Error: {e}{Style.RESET_ALL}")
 
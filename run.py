@@ -6,13 +6,24 @@ import numpy as np
 import os
 from dotenv import load_dotenv
 import json
-import base64
+import binascii
 import queue
-import tiktoken
+import signal
+import multiprocessing
+from multiprocessing import shared_memory
 import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
-from collections import deque
-import threading
+
+try:
+    import orjson  # Optional: much faster on the large audio delta events
+    json_loads = orjson.loads
+
+    def json_dumps_bytes(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps_bytes(obj):
+        return json.dumps(obj, indent=2).encode()
 
 load_dotenv()
 
@@ -26,6 +37,37 @@ MODEL = "gpt-4o-mini-realtime-preview"
 # OpenAI Realtime uses 24kHz for audio
 SAMPLE_RATE = 24000
 CHUNK_SIZE = 1024
+MIC_QUEUE_SIZE = 32  # Pending mic frames before the oldest is dropped
+MIC_SEND_WINDOW = 0.08  # Seconds of mic audio batched per send (well under prefix_padding_ms)
+MIC_BLOCK_SIZE = 480  # Samples per mic callback (20ms)
+MIC_BATCH_BYTES = MIC_BLOCK_SIZE * 2 * 8  # Up to 8 int16 frames per send when catching up on a backlog
+# Precomputed JSON envelope for input_audio_buffer.append
+MIC_MSG_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+MIC_MSG_SUFFIX = '"}'
+# Ring capacities are powers of two so index wrap is a mask instead of a modulo
+INPUT_RING_SIZE = 1 << 15  # ~1.4 seconds of mic audio for the waveform
+INPUT_RING_MASK = INPUT_RING_SIZE - 1
+PLAYBACK_RING_SIZE = 1 << 21  # ~87 seconds of assistant audio, enough to hold a whole reply ahead of playback
+PLAYBACK_RING_MASK = PLAYBACK_RING_SIZE - 1
+# Adaptive jitter buffer: prebuffer k * (RFC 3550 interarrival jitter of audio deltas), clipped to a sane range
+JITTER_EWMA_ALPHA = 1 / 16
+JITTER_K = 3
+JITTER_MIN_SAMPLES = int(SAMPLE_RATE * 0.04)
+JITTER_MAX_SAMPLES = int(SAMPLE_RATE * 0.4)
+WAVEFORM_STRIDE = INPUT_RING_SIZE // 1024  # Plot ~1000 waveform points instead of the full ring
+TRANSCRIPT_FLUSH_INTERVAL = 0.1  # Seconds between console writes of streamed transcript text
+# Slots in the shared metrics array read by the dashboard process
+M_RUNNING, M_WRITE_IDX, M_IN_TEXT, M_IN_AUDIO, M_OUT_TEXT, M_OUT_AUDIO, M_TOTAL, M_COST = range(8)
+METRICS_SIZE = 8
+# Dashboard metrics text, filled straight from the M_IN_TEXT..M_COST slots in order
+METRICS_TEMPLATE = (
+    "Input Text Tokens: %d\n"
+    "Input Audio Tokens: %d\n"
+    "Output Text Tokens: %d\n"
+    "Output Audio Tokens: %d\n\n"
+    "Total Tokens: %d\n"
+    "ESTIMATED COST: $%.4f"
+)
 
 # Official OpenAI gpt-4o-mini-realtime-preview pricing (per 1M tokens)
 PRICES = {
@@ -40,69 +82,160 @@ PRICES = {
 # Shared state
 class AppState:
     def __init__(self):
-        self.playback_deque = deque()
-        self.playback_lock = threading.Lock()
-        self.input_audio_buffer = np.zeros(SAMPLE_RATE)  # 1 second of audio
+        # Playback ring: receive_events is the only writer, the audio callback the only reader
+        # Mirrored: sample i is also stored at i + PLAYBACK_RING_SIZE, so any read is one contiguous slice
+        self.pb_buf = np.zeros(2 * PLAYBACK_RING_SIZE, dtype=np.int16)
+        self.pb_w = 0
+        self.pb_r = 0
+        # Waveform ring and dashboard metrics; moved into shared memory by start_dashboard()
+        self.input_audio_buffer = np.zeros(INPUT_RING_SIZE, dtype=np.float32)
+        self.input_write_idx = 0  # Next ring position the mic callback writes to
+        self.metrics = np.zeros(METRICS_SIZE)
         self.usage = {
             "total_tokens": 0,
             "input_tokens": 0,
             "output_tokens": 0,
-            "input_details": {"text_tokens": 0, "audio_tokens": 0},
+            "input_details": {"text_tokens": 0, "audio_tokens": 0, "cached_tokens": 0},
             "output_details": {"text_tokens": 0, "audio_tokens": 0}
         }
         self.transcript = []
         self.cost = 0.0
         self.is_running = True
-        self.fig = None  
-        self.jitter_buffer_threshold = 5  # Start playing after 5 chunks (~100-200ms)
+        self.jitter_buffer_threshold = int(SAMPLE_RATE * 0.15)  # Prebuffer target; starts at ~150ms, then adapts
         self.is_playing = False
+        self.response_audio_done = False  # No more deltas coming; play out the tail without prebuffering
+        self.last_delta_ts = None  # Arrival time of the previous audio delta in this response
+        self.last_delta_samples = 0  # Media length of the previous audio delta
+        # EWMA of |arrival gap - media duration of the previous delta|; seeded so k * jitter is the 150ms start
+        self.delta_jitter = self.jitter_buffer_threshold / (JITTER_K * SAMPLE_RATE)
+        self.current_transcript = ""  # Assistant text for the response in progress
+        self.pending_text = []  # Transcript deltas not yet written to the console
+        self.last_text_flush = 0.0
         self.start_time = time.time()
 
+    def write_input(self, samples):
+        """Writes mic samples into the waveform ring in place (at most two copies, no roll)."""
+        buf = self.input_audio_buffer
+        n = len(buf)
+        w = self.input_write_idx
+        end = w + len(samples)
+        if end <= n:
+            buf[w:end] = samples
+        else:
+            split = n - w
+            buf[w:] = samples[:split]
+            buf[:end - n] = samples[split:]
+        self.input_write_idx = end & INPUT_RING_MASK
+        self.metrics[M_WRITE_IDX] = self.input_write_idx
+
+    def publish_metrics(self):
+        """Copies usage and cost into the shared metrics array for the dashboard."""
+        in_details = self.usage["input_details"]
+        out_details = self.usage["output_details"]
+        m = self.metrics
+        m[M_IN_TEXT] = in_details.get("text_tokens", 0)
+        m[M_IN_AUDIO] = in_details.get("audio_tokens", 0)
+        m[M_OUT_TEXT] = out_details.get("text_tokens", 0)
+        m[M_OUT_AUDIO] = out_details.get("audio_tokens", 0)
+        m[M_TOTAL] = self.usage.get("total_tokens", 0)
+        m[M_COST] = self.cost
+
+    def write_playback(self, samples):
+        """Copies assistant audio into both halves of the mirrored playback ring and publishes the write index."""
+        buf = self.pb_buf
+        n = PLAYBACK_RING_SIZE
+        w = self.pb_w
+        # One slot always stays empty so a full ring never looks like an empty one
+        free = n - 1 - ((w - self.pb_r) & PLAYBACK_RING_MASK)
+        if len(samples) > free:
+            print(f"\n[Playback buffer full: dropped {len(samples) - free} samples]")
+            samples = samples[:free]
+        end = w + len(samples)
+        np.copyto(buf[w:end], samples)
+        if end <= n:
+            np.copyto(buf[w + n:end + n], samples)
+        else:
+            split = n - w
+            np.copyto(buf[w + n:], samples[:split])
+            np.copyto(buf[:end - n], samples[split:])
+        # Publish only after the samples are in place so the reader never sees stale data
+        self.pb_w = end & PLAYBACK_RING_MASK
+
+    def track_delta_arrival(self, samples):
+        """Updates the delta jitter estimate and retunes the prebuffer target from it."""
+        now = time.monotonic()
+        last = self.last_delta_ts
+        prev_samples = self.last_delta_samples
+        self.last_delta_ts = now
+        self.last_delta_samples = samples
+        if last is None:
+            return
+        # Transit variation: how far the gap strayed from the audio the previous delta carried
+        transit = (now - last) - prev_samples / SAMPLE_RATE
+        self.delta_jitter += JITTER_EWMA_ALPHA * (abs(transit) - self.delta_jitter)
+        target = int(JITTER_K * self.delta_jitter * SAMPLE_RATE)
+        self.jitter_buffer_threshold = min(max(target, JITTER_MIN_SAMPLES), JITTER_MAX_SAMPLES)
+
 state = AppState()
 
+# Session report header, filled with format_map at shutdown; the transcript follows it
+REPORT_TEMPLATE = "\n".join([
+    "# NOA Session Detailed Report",
+    "**Date:** {date}",
+    "**Session Duration:** {minutes}m {seconds}s",
+    "\n## 1. Usage Summary",
+    "- **Total Tokens:** {total_tokens:,}",
+    "- **Total Cost (USD):** ${cost:.6f}",
+    "\n### Token Breakdown",
+    "| Modality | Input Tokens | Output Tokens |",
+    "| :--- | :--- | :--- |",
+    "| **Text** | {in_text:,} | {out_text:,} |",
+    "| **Audio** | {in_audio:,} | {out_audio:,} |",
+    "| **Cached** | {in_cached:,} | - |",
+    "\n## 2. Full Transcript",
+    "---",
+])
+
 def save_session():
-    """Saves the dashboard, transcript, and a detailed session report."""
+    """Saves the transcript and a detailed session report (the dashboard process saves its own plot)."""
     print("\n[Generating detailed session report...]")
     
     duration = time.time() - state.start_time
     minutes = int(duration // 60)
     seconds = int(duration % 60)
     
-    # Save Plot
-    if state.fig:
-        state.fig.savefig("session_dashboard.png")
-    
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+    in_details = state.usage['input_details']
+    out_details = state.usage['output_details']
+
     # Generate Detailed Markdown Report
-    report = [
-        "# NOA Session Detailed Report",
-        f"**Date:** {time.strftime('%Y-%m-%d %H:%M:%S')}",
-        f"**Session Duration:** {minutes}m {seconds}s",
-        "\n## 1. Usage Summary",
-        f"- **Total Tokens:** {state.usage.get('total_tokens', 0):,}",
-        f"- **Total Cost (USD):** ${state.cost:.6f}",
-        "\n### Token Breakdown",
-        "| Modality | Input Tokens | Output Tokens |",
-        "| :--- | :--- | :--- |",
-        f"| **Text** | {state.usage['input_details'].get('text_tokens', 0):,} | {state.usage['output_details'].get('text_tokens', 0):,} |",
-        f"| **Audio** | {state.usage['input_details'].get('audio_tokens', 0):,} | {state.usage['output_details'].get('audio_tokens', 0):,} |",
-        f"| **Cached** | {state.usage['input_details'].get('cached_tokens', 0):,} | - |",
-        "\n## 2. Full Transcript",
-        "---"
-    ]
-    report.extend(state.transcript)
+    report = REPORT_TEMPLATE.format_map({
+        "date": timestamp,
+        "minutes": minutes,
+        "seconds": seconds,
+        "total_tokens": state.usage.get('total_tokens', 0),
+        "cost": state.cost,
+        "in_text": in_details.get('text_tokens', 0),
+        "out_text": out_details.get('text_tokens', 0),
+        "in_audio": in_details.get('audio_tokens', 0),
+        "out_audio": out_details.get('audio_tokens', 0),
+        "in_cached": in_details.get('cached_tokens', 0),
+    })
+    if state.transcript:
+        report += "\n" + "\n".join(state.transcript)
     
     with open("session_report.md", "w") as f:
-        f.write("\n".join(report))
+        f.write(report)
     
     # Keep JSON for machine readability
     summary = {
-        "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
+        "timestamp": timestamp,
         "duration_seconds": duration,
         "usage": state.usage,
         "total_cost_usd": state.cost
     }
-    with open("session_summary.json", "w") as f:
-        json.dump(summary, f, indent=4)
+    with open("session_summary.json", "wb") as f:
+        f.write(json_dumps_bytes(summary))
     
     # Keep plain transcript.txt for compatibility
     with open("transcript.txt", "w") as f:
@@ -657,173 +790,213 @@ When the system detects that a user may benefit from CBT and you offer a CBT ses
     }
 }
 
-# Initialize tiktoken encoder
-encoder = tiktoken.get_encoding("cl100k_base")
-
 def calculate_cost(usage):
-    input_details = usage.get("input_details", {})
-    output_details = usage.get("output_details", {})
+    """Prices a single response's usage block; the session total is the running sum of these."""
+    input_details = usage.get("input_token_details") or {}
+    output_details = usage.get("output_token_details") or {}
     
+    # Cached tokens are a subset of each modality's input count: bill them at the cached rate, the rest at full rate
+    cached_details = input_details.get("cached_tokens_details") or {}
+    cached_text = cached_details.get("text_tokens", 0)
+    cached_audio = cached_details.get("audio_tokens", 0)
+
     # Text Costs
-    in_text = (input_details.get("text_tokens", 0) / 1_000_000) * PRICES["input_text"]
-    in_text_cached = (input_details.get("cached_tokens", 0) / 1_000_000) * PRICES["input_text_cached"]
+    in_text = (max(input_details.get("text_tokens", 0) - cached_text, 0) / 1_000_000) * PRICES["input_text"]
+    in_text_cached = (cached_text / 1_000_000) * PRICES["input_text_cached"]
     out_text = (output_details.get("text_tokens", 0) / 1_000_000) * PRICES["output_text"]
     
     # Audio Costs
-    in_audio = (input_details.get("audio_tokens", 0) / 1_000_000) * PRICES["input_audio"]
+    in_audio = (max(input_details.get("audio_tokens", 0) - cached_audio, 0) / 1_000_000) * PRICES["input_audio"]
     # Note: real-time audio caching is rare but we handle it if provided
-    in_audio_cached = (input_details.get("cached_audio_tokens", 0) / 1_000_000) * PRICES["input_audio_cached"]
+    in_audio_cached = (cached_audio / 1_000_000) * PRICES["input_audio_cached"]
     out_audio = (output_details.get("audio_tokens", 0) / 1_000_000) * PRICES["output_audio"]
     
     return in_text + in_text_cached + out_text + in_audio + in_audio_cached + out_audio
 
+async def mic_pump(ws, mic_q):
+    """Base64-encodes queued mic frames and sends them, off the realtime audio thread."""
+    batch = memoryview(bytearray(MIC_BATCH_BYTES))  # Reused for every send
+    frame_bytes = MIC_BLOCK_SIZE * 2
+    while state.is_running:
+        try:
+            raw = await asyncio.wait_for(mic_q.get(), timeout=0.1)
+        except asyncio.TimeoutError:
+            continue
+        # Coalesce the frames arriving within the send window into one append message
+        n = len(raw)
+        batch[:n] = raw
+        deadline = loop.time() + MIC_SEND_WINDOW
+        while n + frame_bytes <= MIC_BATCH_BYTES and (remaining := deadline - loop.time()) > 0:
+            try:
+                raw = await asyncio.wait_for(mic_q.get(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            batch[n:n + len(raw)] = raw
+            n += len(raw)
+        # Base64 output is plain ASCII, so the JSON envelope is just string concatenation
+        encoded = binascii.b2a_base64(batch[:n], newline=False).decode("ascii")
+        await ws.send(MIC_MSG_PREFIX + encoded + MIC_MSG_SUFFIX)
+
 async def send_audio(ws):
     """Captures audio from mic and sends it to OpenAI."""
+    mic_q = asyncio.Queue(maxsize=MIC_QUEUE_SIZE)
+
+    def enqueue(raw):
+        # Runs on the event loop; drop the oldest frame rather than grow without bound
+        if mic_q.full():
+            mic_q.get_nowait()
+        mic_q.put_nowait(raw)
+
     def callback(indata, frames, time, status):
-        # Update visualization buffer
-        state.input_audio_buffer = np.roll(state.input_audio_buffer, -frames)
-        state.input_audio_buffer[-frames:] = indata[:, 0]
-        
-        audio_bytes = indata.tobytes()
-        encoded = base64.b64encode(audio_bytes).decode("utf-8")
-        
-        asyncio.run_coroutine_threadsafe(
-            ws.send(json.dumps({
-                "type": "input_audio_buffer.append",
-                "audio": encoded
-            })),
-            loop
-        )
+        # Update visualization ring buffer in place
+        state.write_input(indata[:, 0])
+        # Only copy the raw frame here; encoding and sending happen in mic_pump
+        loop.call_soon_threadsafe(enqueue, bytes(indata))
 
     with sd.InputStream(samplerate=SAMPLE_RATE, channels=1, dtype="int16", 
-                         blocksize=480, callback=callback):
-        while state.is_running:
-            await asyncio.sleep(0.1)
+                         blocksize=MIC_BLOCK_SIZE, callback=callback):
+        await mic_pump(ws, mic_q)
+
+def _flush_pending_text():
+    """Writes buffered transcript deltas to the console in one flushed print."""
+    if state.pending_text:
+        print("".join(state.pending_text), end="", flush=True)
+        state.pending_text.clear()
+    state.last_text_flush = time.monotonic()
+
+def _handle_audio_delta(message):
+    state.response_audio_done = False
+    # Copy straight out of a view on the decoded bytes; nothing keeps them alive afterwards
+    samples = np.frombuffer(binascii.a2b_base64(message["delta"]), dtype=np.int16)
+    state.track_delta_arrival(len(samples))
+    state.write_playback(samples)
+
+def _handle_transcript_delta(message):
+    delta = message["delta"]
+    state.current_transcript += delta
+    state.pending_text.append(delta)
+    # Batch console writes instead of a flushed print per token
+    if time.monotonic() - state.last_text_flush >= TRANSCRIPT_FLUSH_INTERVAL:
+        _flush_pending_text()
+
+def _handle_user_transcript(message):
+    user_text = message.get("transcript", "").strip()
+    if user_text:
+        state.transcript.append(f"User: {user_text}")
+        print(f"\n[User]: {user_text}")
+
+def _handle_response_done(message):
+    # The gap before the next response is think time, not network jitter
+    state.last_delta_ts = None
+    state.response_audio_done = True
+    _flush_pending_text()
+
+    # Save sentence to transcript state
+    if state.current_transcript:
+        state.transcript.append(f"Assistant: {state.current_transcript.strip()}")
+        state.current_transcript = ""
+
+    # Final usage update from OpenAI
+    resp = message.get("response", {})
+    usage = resp.get("usage")
+    if usage:
+        state.usage["total_tokens"] += usage.get("total_tokens", 0)
+        state.usage["input_tokens"] += usage.get("input_tokens", 0)
+        state.usage["output_tokens"] += usage.get("output_tokens", 0)
+
+        in_details = usage.get("input_token_details") or {}
+        out_details = usage.get("output_token_details") or {}
+
+        state.usage["input_details"]["text_tokens"] += in_details.get("text_tokens", 0)
+        state.usage["input_details"]["audio_tokens"] += in_details.get("audio_tokens", 0)
+        # cached_tokens is already the text+audio total
+        state.usage["input_details"]["cached_tokens"] += in_details.get("cached_tokens", 0)
+        state.usage["output_details"]["text_tokens"] += out_details.get("text_tokens", 0)
+        state.usage["output_details"]["audio_tokens"] += out_details.get("audio_tokens", 0)
+
+        # Add this turn's cost rather than re-pricing the accumulated totals
+        state.cost += calculate_cost(usage)
+        state.publish_metrics()
+        print(f"\n[Turn Cost Update: ${state.cost:.4f} | Total: {state.usage['total_tokens']} tokens]")
+
+def _handle_error(message):
+    print(f"\n[Error]: {message.get('error', {}).get('message')}")
+
+def _ignore_event(message):
+    pass
+
+# Event type -> handler; one dict lookup per event instead of an if/elif string chain
+EVENT_HANDLERS = {
+    "response.audio.delta": _handle_audio_delta,
+    "response.audio_transcript.delta": _handle_transcript_delta,
+    "conversation.item.input_audio_transcription.completed": _handle_user_transcript,
+    "response.done": _handle_response_done,
+    "error": _handle_error,
+}
 
 async def receive_events(ws):
     """Handles incoming events and updates usage/cost."""
-    current_transcript = ""
+    handlers = EVENT_HANDLERS
     while state.is_running:
         try:
             response = await ws.recv()
-            message = json.loads(response)
-
-            if message["type"] == "response.audio.delta":
-                audio_data = base64.b64decode(message["delta"])
-                audio_array = np.frombuffer(audio_data, dtype=np.int16)
-                with state.playback_lock:
-                    state.playback_deque.append(audio_array)
-
-            elif message["type"] == "response.audio_transcript.delta":
-                delta = message["delta"]
-                current_transcript += delta
-                print(delta, end="", flush=True)
-            
-            elif message["type"] == "conversation.item.input_audio_transcription.completed":
-                user_text = message.get("transcript", "").strip()
-                if user_text:
-                    state.transcript.append(f"User: {user_text}")
-                    print(f"\n[User]: {user_text}")
-
-            elif message["type"] == "response.done":
-                # Save sentence to transcript state
-                if current_transcript:
-                    state.transcript.append(f"Assistant: {current_transcript.strip()}")
-                    current_transcript = ""
-                
-                # Final usage update from OpenAI
-                resp = message.get("response", {})
-                usage = resp.get("usage")
-                if usage:
-                    # Clear zero-state if this is the first real usage
-                    state.usage["total_tokens"] += usage.get("total_tokens", 0)
-                    state.usage["input_tokens"] += usage.get("input_tokens", 0)
-                    state.usage["output_tokens"] += usage.get("output_tokens", 0)
-                    
-                    in_details = usage.get("input_details", {})
-                    out_details = usage.get("output_details", {})
-                    
-                    state.usage["input_details"]["text_tokens"] += in_details.get("text_tokens", 0)
-                    state.usage["input_details"]["audio_tokens"] += in_details.get("audio_tokens", 0)
-                    state.usage["output_details"]["text_tokens"] += out_details.get("text_tokens", 0)
-                    state.usage["output_details"]["audio_tokens"] += out_details.get("audio_tokens", 0)
-                    
-                    state.cost = calculate_cost(state.usage)
-                    print(f"\n[Turn Cost Update: ${state.cost:.4f} | Total: {state.usage['total_tokens']} tokens]")
-                else:
-                    # Fallback check for session usage (some models put it elsewhere)
-                    pass
-            
-            elif message["type"] == "error":
-                print(f"\n[Error]: {message.get('error', {}).get('message')}")
+            message = json_loads(response)
+            handlers.get(message["type"], _ignore_event)(message)
         except websockets.ConnectionClosed:
             print("Websocket connection closed")
             state.is_running = False
             break
-            state.is_running = False
-            break
 
 def playback_callback(outdata, frames, time, status):
-    if status:
-        # Avoid printing in the callback thread unless necessary
-        pass
-    
-    outdata.fill(0)
-    
-    with state.playback_lock:
-        # Continuous playback logic
-        # If we weren't playing, wait for the jitter buffer to fill
-        if not state.is_playing:
-            if len(state.playback_deque) >= state.jitter_buffer_threshold:
-                state.is_playing = True
-            else:
-                return
-
-        # If we ARE playing but queue is empty, don't stop immediately
-        # Just return zeros (silence) for this frame and keep is_playing=True
-        # We only stop if we've been empty for a while OR if explicitly told?
-        # A simpler way: just play what we have, stay 'True' until the end of the response.
-        if not state.playback_deque:
-            # We add a small "cooldown" before resetting is_playing if we want,
-            # but for now, let's just let it stay True until the response finishes.
-            # However, sd.OutputStream is always running, so we just return if empty.
-            return
+    r = state.pb_r
+    available = (state.pb_w - r) & PLAYBACK_RING_MASK
+
+    # Hold silence until the jitter buffer fills; after that just drain whatever is there.
+    # The adaptive target only gates this prebuffer; queued audio is never skipped.
+    if not state.is_playing and available < state.jitter_buffer_threshold and not state.response_audio_done:
+        outdata.fill(0)
+        return
+
+    count = min(available, frames)
+    out = outdata[:, 0]
+    np.copyto(out[:count], state.pb_buf[r:r + count])
+    out[count:] = 0
+    state.pb_r = (r + count) & PLAYBACK_RING_MASK
+    # Re-prime once the ring runs dry so the next burst is prebuffered again
+    state.is_playing = available > count
+
+def dashboard_process(wave_name, metrics_name):
+    """Matplotlib dashboard, run in its own process so redraws never stall the websocket loop."""
+    # Ctrl+C reaches the whole process group; the parent stops us via M_RUNNING so the PNG still gets saved
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    wave_shm = shared_memory.SharedMemory(name=wave_name)
+    metrics_shm = shared_memory.SharedMemory(name=metrics_name)
+    ring = np.ndarray((INPUT_RING_SIZE,), dtype=np.float32, buffer=wave_shm.buf)
+    metrics = np.ndarray((METRICS_SIZE,), dtype=np.float64, buffer=metrics_shm.buf)
 
-        filled = 0
-        while filled < frames and state.playback_deque:
-            chunk = state.playback_deque.popleft()
-            chunk_len = len(chunk)
-            needed = frames - filled
-            
-            if chunk_len > needed:
-                outdata[filled:frames, 0] = chunk[:needed]
-                state.playback_deque.appendleft(chunk[needed:])
-                filled = frames
-            else:
-                outdata[filled:filled+chunk_len, 0] = chunk
-                filled += chunk_len
-
-async def dashboard_task():
-    """Matplotlib dashboard task."""
     plt.style.use('dark_background')
-    state.fig = plt.figure(figsize=(10, 8))
-    gs = state.fig.add_gridspec(3, 1)
+    fig = plt.figure(figsize=(10, 8))
+    gs = fig.add_gridspec(3, 1)
     
-    ax1 = state.fig.add_subplot(gs[0, 0])
-    ax2 = state.fig.add_subplot(gs[1, 0])
-    ax3 = state.fig.add_subplot(gs[2, 0])
+    ax1 = fig.add_subplot(gs[0, 0])
+    ax2 = fig.add_subplot(gs[1, 0])
+    ax3 = fig.add_subplot(gs[2, 0])
     
-    state.fig.canvas.manager.set_window_title('NOA Assistant Dashboard')
+    fig.canvas.manager.set_window_title('NOA Assistant Dashboard')
 
     # Waveform plot (Contour)
-    line, = ax1.plot(state.input_audio_buffer, color='#00ff00', linewidth=0.5)
+    line, = ax1.plot(np.zeros(INPUT_RING_SIZE // WAVEFORM_STRIDE), color='#00ff00', linewidth=0.5)
     ax1.set_ylim(-32768, 32767)
     ax1.set_title("Live Audio Contour (Waveform)")
     ax1.set_axis_off()
 
     # Heatmap (Intensity over time)
-    intensity_data = np.zeros((1, 100))
-    heatmap = ax2.imshow(intensity_data, aspect='auto', cmap='magma', vmin=0, vmax=10000)
+    # Mirrored ring: column i is also stored at i + cols, so the latest cols values are one slice
+    cols = 100
+    intensity_data = np.zeros((1, 2 * cols))
+    heat_idx = 0
+    last_usage = None  # Usage snapshot behind the current metrics text
+    heatmap = ax2.imshow(intensity_data[:, :cols], aspect='auto', cmap='magma', vmin=0, vmax=10000)
     ax2.set_title("Energy Heatmap")
     ax2.set_axis_off()
 
@@ -834,39 +1007,100 @@ async def dashboard_task():
     ax3.set_axis_off()
 
     def update(frame):
-        # Update Waveform
-        line.set_ydata(state.input_audio_buffer)
+        w = int(metrics[M_WRITE_IDX])
+        # Update Waveform every other frame (unroll the shared ring oldest-to-newest)
+        if frame % 2 == 0:
+            waveform = np.concatenate((ring[w:], ring[:w]))
+            line.set_ydata(waveform[::WAVEFORM_STRIDE])
         
         # Update Heatmap
-        nonlocal intensity_data
-        rms = np.sqrt(np.mean(state.input_audio_buffer[-1024:]**2))
-        intensity_data = np.roll(intensity_data, -1)
-        intensity_data[0, -1] = rms
-        heatmap.set_data(intensity_data)
-        
-        # Robust metric display
-        in_details = state.usage.get("input_details", {})
-        out_details = state.usage.get("output_details", {})
-        
-        usage_info = (
-            f"Input Text Tokens: {in_details.get('text_tokens', 0)}\n"
-            f"Input Audio Tokens: {in_details.get('audio_tokens', 0)}\n"
-            f"Output Text Tokens: {out_details.get('text_tokens', 0)}\n"
-            f"Output Audio Tokens: {out_details.get('audio_tokens', 0)}\n\n"
-            f"Total Tokens: {state.usage.get('total_tokens', 0)}\n"
-            f"ESTIMATED COST: ${state.cost:.4f}"
-        )
-        metrics_text.set_text(usage_info)
+        nonlocal heat_idx, last_usage
+        # Last 1024 samples straight from the ring; only a wrapped tail needs a copy
+        tail = ring[w - 1024:w] if w >= 1024 else np.concatenate((ring[w - 1024:], ring[:w]))
+        # Sum of squares as a float32 dot product: one pass, no squared temporary
+        rms = np.sqrt(np.dot(tail, tail) / len(tail))
+        intensity_data[0, heat_idx] = rms
+        intensity_data[0, heat_idx + cols] = rms
+        heat_idx = (heat_idx + 1) % cols
+        heatmap.set_data(intensity_data[:, heat_idx:heat_idx + cols])
+
+        # Usage only changes on response.done; skip the text re-layout on every other frame
+        usage = tuple(metrics[M_IN_TEXT:M_COST + 1].tolist())
+        if usage != last_usage:
+            last_usage = usage
+            metrics_text.set_text(METRICS_TEMPLATE % usage)
         return line, heatmap, metrics_text
 
-    ani = FuncAnimation(state.fig, update, interval=100, blit=True, cache_frame_data=False)
+    # Manual blitting: the background is cached once and only the three animated artists are redrawn
+    artists = (line, heatmap, metrics_text)
+    for artist in artists:
+        artist.set_animated(True)
+    background = None
+    frame = 0
+
+    def on_draw(event):
+        # Full redraws (first show, resize) repaint the static parts; recapture them
+        nonlocal background
+        background = fig.canvas.copy_from_bbox(fig.bbox)
+
+    def tick():
+        nonlocal frame
+        if background is None:
+            return
+        update(frame)
+        frame += 1
+        fig.canvas.restore_region(background)
+        for artist in artists:
+            artist.axes.draw_artist(artist)
+        for ax in (ax1, ax2, ax3):
+            fig.canvas.blit(ax.bbox)
+
+    fig.canvas.mpl_connect('draw_event', on_draw)
     plt.show(block=False)
+    fig.canvas.draw()
+
+    timer = fig.canvas.new_timer(interval=100)
+    timer.add_callback(tick)
+    timer.start()
     
-    while state.is_running:
-        state.fig.canvas.draw()
-        state.fig.canvas.flush_events()
-        await asyncio.sleep(0.1)
-    plt.close()
+    # The timer fires from the GUI event loop; only pump events here
+    while metrics[M_RUNNING]:
+        fig.canvas.flush_events()
+        time.sleep(0.1)
+    timer.stop()
+    fig.savefig("session_dashboard.png")
+    plt.close(fig)
+
+    # Views must be released before the shared blocks can be closed
+    del timer, tick, update, ring, metrics
+    wave_shm.close()
+    metrics_shm.close()
+
+def start_dashboard():
+    """Moves the waveform ring and metrics into shared memory and starts the dashboard process."""
+    wave_shm = shared_memory.SharedMemory(create=True, size=INPUT_RING_SIZE * 4)
+    metrics_shm = shared_memory.SharedMemory(create=True, size=METRICS_SIZE * 8)
+    state.input_audio_buffer = np.ndarray((INPUT_RING_SIZE,), dtype=np.float32, buffer=wave_shm.buf)
+    state.input_audio_buffer.fill(0)
+    state.metrics = np.ndarray((METRICS_SIZE,), dtype=np.float64, buffer=metrics_shm.buf)
+    state.metrics.fill(0)
+    state.metrics[M_RUNNING] = 1
+    proc = multiprocessing.Process(target=dashboard_process, args=(wave_shm.name, metrics_shm.name), daemon=True)
+    proc.start()
+    return proc, wave_shm, metrics_shm
+
+def stop_dashboard(proc, wave_shm, metrics_shm):
+    """Signals the dashboard to save its plot and exit, then frees the shared memory."""
+    state.metrics[M_RUNNING] = 0
+    proc.join(timeout=5)
+    if proc.is_alive():
+        proc.terminate()
+    # Swap back to private arrays so no views into the shared blocks remain
+    state.input_audio_buffer = np.zeros(INPUT_RING_SIZE, dtype=np.float32)
+    state.metrics = np.zeros(METRICS_SIZE)
+    for shm in (wave_shm, metrics_shm):
+        shm.close()
+        shm.unlink()
 
 async def main():
     global loop
@@ -878,24 +1112,26 @@ async def main():
         "OpenAI-Beta": "realtime=v1"
     }
 
+    dashboard = start_dashboard()
+
     print(f"Connecting to {url}...")
     try:
-        async with websockets.connect(url, extra_headers=headers) as ws:
+        async with websockets.connect(url, extra_headers=headers, compression=None) as ws:
             print("Connected to OpenAI Realtime")
             await ws.send(json.dumps(config))
 
             with sd.OutputStream(samplerate=SAMPLE_RATE, channels=1, dtype="int16", 
-                                 blocksize=SAMPLE_RATE//10,  # 100ms blocks
+                                 blocksize=0, latency='low',  # Device-native period instead of fixed 100ms blocks
                                  callback=playback_callback):
                 await asyncio.gather(
                     send_audio(ws),
-                    receive_events(ws),
-                    dashboard_task()
+                    receive_events(ws)
                 )
     except Exception as e:
         print(f"Failed to connect or running error: {e}")
     finally:
         state.is_running = False
+        stop_dashboard(*dashboard)
         save_session()
 
 if __name__ == "__main__":
@@ -1,9 +1,25 @@
 from faster_whisper import WhisperModel
+import ctranslate2
 import numpy as np
+import os
 
 class STT:
-    def __init__(self, model_size="small", device="cpu", compute_type="int8"):
-        self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
+    def __init__(self, model_size="small", device="auto", compute_type=None, cpu_threads=None, language=None):
+        if device == "auto":
+            device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        if compute_type is None:
+            # int8 weights everywhere; keep fp16 activations on GPU
+            compute_type = "int8" if device == "cpu" else "int8_float16"
+        # Pin intra-op threads explicitly; one worker since utterances are transcribed one at a time
+        self.model = WhisperModel(
+            model_size,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads or os.cpu_count() or 4,
+            num_workers=1,
+        )
+        # A fixed language skips the per-utterance language detection pass (None = auto-detect)
+        self.language = language
 
     def transcribe(self, audio_data: np.ndarray):
         """
@@ -12,18 +28,28 @@ class STT:
         # faster-whisper can take a numpy array directly
         segments, info = self.model.transcribe(
             audio_data,
+            language=self.language,
             beam_size=1,
+            best_of=1,
+            temperature=0.0,
             vad_filter=True,
-            condition_on_previous_text=False
+            vad_parameters={"min_silence_duration_ms": 500},
+            condition_on_previous_text=False,
+            without_timestamps=True
         )
         text = "".join([segment.text for segment in segments]).strip()
         return text, info
 
+    def warmup(self):
+        """Runs a dummy 1-second transcription so the first real utterance doesn't pay cold-start cost."""
+        # VAD would drop pure silence before the encoder, so bypass it; segments is lazy
+        segments, _ = self.model.transcribe(np.zeros(16000, dtype=np.float32), beam_size=1, vad_filter=False)
+        list(segments)
+
 # For testing
 if __name__ == "__main__":
     stt = STT()
     # Dummy transcription attempt if file exists
-    import os
     if os.path.exists("output.wav"):
         import soundfile as sf
         audio, _ = sf.read("output.wav")
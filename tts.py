@@ -1,8 +1,9 @@
 from openai import OpenAI
 import os
-import io
+import queue
+import httpx
+import numpy as np
 import sounddevice as sd
-import soundfile as sf
 import threading
 from dotenv import load_dotenv
 from colorama import Fore, Style, init
@@ -10,9 +11,18 @@ from colorama import Fore, Style, init
 load_dotenv()
 init(autoreset=True)
 
+PCM_SAMPLE_RATE = 24000  # response_format="pcm" is raw 24kHz mono int16
+PLAYER_BLOCKSIZE = 2400  # 100ms callback blocks for the local player
+
 class TTS:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # Persistent HTTP/2 client: one warm TLS connection is reused across sentences
+        http_client = httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(30.0, connect=3.0)
+        )
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
         self.model = "gpt-4o-mini-tts"
         self.is_playing = False
         self.instructions = (
@@ -20,6 +30,17 @@ class TTS:
             "Sound like a caring friend — gentle, emotionally present, and expressive. "
             "Vary your pace and intonation naturally. Show genuine feeling in your voice."
         )
+        # Local player: one long-lived output stream fed from a queue, opened on first use
+        self._stream = None
+        self._text_q = queue.Queue()  # (generation, sentence) waiting to be synthesized
+        self._pcm_q = queue.Queue()  # (generation, int16 chunk) waiting to be played
+        self._pending = None  # Partially played chunk carried across callbacks; callback-owned
+        self._pending_gen = 0
+        self._outstanding = 0  # Sentences queued or being synthesized; guarded by _count_lock
+        self._count_lock = threading.Lock()
+        self._stop_gen = 0  # Bumped by stop_local(); queued text and audio from older generations is dropped
+        self._idle = threading.Event()  # Set once everything queued has been played
+        self._idle.set()
 
     def get_audio_bytes(self, text):
         """Synthesizes text and returns the raw audio bytes (opus)."""
@@ -41,28 +62,99 @@ class TTS:
             print(f"{Fore.RED}TTS Error: {e}{Style.RESET_ALL}")
             return None
 
-    def _play_audio_local(self, data, samplerate):
-        """Internal helper for local testing."""
-        self.is_playing = True
-        try:
-            sd.play(data, samplerate)
-            sd.wait()
-        except Exception as e:
-            print(f"{Fore.RED}Playback error: {e}{Style.RESET_ALL}")
-        finally:
-            self.is_playing = False
+    def stream_pcm(self, text, chunk_size=4096):
+        """Yields raw PCM chunks as the TTS response streams in, instead of waiting for the whole file."""
+        with self.client.audio.speech.with_streaming_response.create(
+            model=self.model,
+            voice="nova",
+            input=text,
+            instructions=self.instructions,
+            response_format="pcm",
+            speed=1.05,
+        ) as response:
+            for chunk in response.iter_bytes(chunk_size):
+                yield chunk
+
+    def _ensure_player(self):
+        """Opens the output stream and synthesis worker once; later calls reuse them."""
+        if self._stream is not None:
+            return
+        self._stream = sd.OutputStream(samplerate=PCM_SAMPLE_RATE, channels=1, dtype="int16",
+                                       blocksize=PLAYER_BLOCKSIZE, callback=self._player_callback)
+        self._stream.start()
+        threading.Thread(target=self._synth_worker, daemon=True).start()
+
+    def _synth_worker(self):
+        """Streams each queued sentence's PCM into the playback queue as it arrives."""
+        while True:
+            gen, text = self._text_q.get()
+            try:
+                # Skips sentences queued before the last stop_local() without synthesizing them
+                if gen != self._stop_gen:
+                    continue
+                for chunk in self.stream_pcm(text):
+                    if gen != self._stop_gen:
+                        break
+                    self._pcm_q.put((gen, np.frombuffer(chunk, dtype=np.int16)))
+            except Exception as e:
+                print(f"{Fore.RED}Playback error: {e}{Style.RESET_ALL}")
+            finally:
+                # Only now is every chunk of this sentence in the playback queue
+                with self._count_lock:
+                    self._outstanding -= 1
+
+    def _player_callback(self, outdata, frames, time, status):
+        out = outdata[:, 0]
+        filled = 0
+        gen = self._stop_gen
+        while filled < frames:
+            # Only this callback touches _pending; audio from before the last stop_local() is dropped here
+            if self._pending is None or self._pending_gen != gen:
+                try:
+                    self._pending_gen, self._pending = self._pcm_q.get_nowait()
+                except queue.Empty:
+                    self._pending = None
+                    break
+                continue
+            chunk = self._pending
+            n = min(len(chunk), frames - filled)
+            out[filled:filled + n] = chunk[:n]
+            filled += n
+            self._pending = chunk[n:] if n < len(chunk) else None
+        out[filled:] = 0
+        # Idle only once the audio ran out and no sentence is still queued or synthesizing;
+        # the lock is only taken on that transition, and it orders us against speak_local()
+        if filled < frames and self._outstanding == 0 and not self._idle.is_set():
+            with self._count_lock:
+                if self._outstanding == 0:
+                    self.is_playing = False
+                    self._idle.set()
 
     def speak_local(self, text):
-        """Synthesizes text and plays it directly (for local debugging)."""
-        audio_data = self.get_audio_bytes(text)
-        if audio_data:
-            with io.BytesIO(audio_data) as audio_file:
-                data, samplerate = sf.read(audio_file)
-                threading.Thread(target=self._play_audio_local, args=(data, samplerate), daemon=True).start()
+        """Queues text for the local player; audio starts on the first streamed chunk."""
+        if text:
+            self._ensure_player()
+            # Count the sentence before it is visible to the worker so the player can't go idle early
+            with self._count_lock:
+                self._outstanding += 1
+                self.is_playing = True
+                self._idle.clear()
+                gen = self._stop_gen
+            self._text_q.put((gen, text))
+
+    def speak(self, text):
+        """Synthesizes text and plays it as raw PCM, blocking until playback finishes."""
+        if text:
+            self.speak_local(text)
+            self._idle.wait()
 
     def stop_local(self):
-        sd.stop()
+        # Discard queued sentences, in-flight synthesis and buffered audio for the local player.
+        # Only the generation changes here: the worker and the player callback drop stale items
+        # themselves, so state they own is never written from this thread.
+        self._stop_gen += 1
         self.is_playing = False
+        self._idle.set()
 
 if __name__ == "__main__":
     tts = TTS()